@@ -4,32 +4,83 @@ Save this as backend/app/auth.py
 """
 
 import os
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 
+import jwt
+from cachetools import TTLCache
+from cryptography.hazmat.primitives import serialization
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jwt import PyJWTError
 from passlib.context import CryptContext
 
 # ───────── Config ─────────
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-please")
-ALGORITHM  = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _load_signing_keys() -> Tuple[Any, Any, str]:
+    """
+    HS256 with SECRET_KEY by default. If JWT_PRIVATE_KEY_FILE points to an
+    Ed25519 PEM key, sign with EdDSA instead. The key is parsed once here,
+    not on every encode/decode.
+    """
+    key_file = os.getenv("JWT_PRIVATE_KEY_FILE")
+    if not key_file:
+        return SECRET_KEY, SECRET_KEY, "HS256"
+    with open(key_file, "rb") as f:
+        private = serialization.load_pem_private_key(f.read(), password=None)
+    return private, private.public_key(), "EdDSA"
+
+
+_SIGNING_KEY, _VERIFY_KEY, ALGORITHM = _load_signing_keys()
+
+# password hashing: argon2id for new hashes; bcrypt and pbkdf2_sha256 (used by
+# the old users.db scripts) kept so old hashes still verify and get rehashed
+# on next login. Built on first use, since passlib
+# probes its backends on construction.
+@lru_cache(maxsize=1)
+def _pwd() -> CryptContext:
+    return CryptContext(
+        schemes=["argon2", "bcrypt", "pbkdf2_sha256"],
+        default="argon2",
+        deprecated="auto",
+        argon2__type="ID",
+        argon2__time_cost=int(os.getenv("ARGON2_T", 2)),
+        argon2__memory_cost=int(os.getenv("ARGON2_M", 19456)),   # KiB
+        argon2__parallelism=int(os.getenv("ARGON2_P", 1)),
+        bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", 12)),
+    )
+
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+# decoded-token cache: raw bearer → payload, so repeat requests skip the HMAC
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 
 # ───────── Helpers ─────────
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return _pwd().verify(plain, hashed)
+
+
+def verify_and_update_password(plain: str,
+                               hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Like verify_password, but also returns a fresh hash when the stored one
+    uses a deprecated scheme / cost (caller should persist it).
+    """
+    return _pwd().verify_and_update(plain, hashed)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return _pwd().hash(password)
 
 
 def create_access_token(data: Dict[str, Any],
@@ -38,7 +89,21 @@ def create_access_token(data: Dict[str, Any],
     expire = datetime.utcnow() + (expires_delta or timedelta(
         minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _SIGNING_KEY, algorithm=ALGORITHM)
+
+
+def invalidate_token(token: str) -> None:
+    """Drop a bearer from the decode cache (logout / password change)."""
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE.pop(token, None)
+
+
+def _credentials_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
 
 
 def require_token(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
@@ -47,12 +112,20 @@ def require_token(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
         payload = Depends(require_token)
     Raises 401 if the bearer-token is invalid.
     """
+    # TTLCache reads expire entries (a mutation), so they need the lock too
+    with _TOKEN_CACHE_LOCK:
+        payload = _TOKEN_CACHE.get(token)
+        if payload is not None:
+            # the cache TTL may outlive the token itself
+            if payload.get("exp", 0) > time.time():
+                return payload
+            _TOKEN_CACHE.pop(token, None)
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        payload = jwt.decode(token, _VERIFY_KEY, algorithms=[ALGORITHM])
+    except PyJWTError:
+        raise _credentials_error()
+
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = payload
+    return payload
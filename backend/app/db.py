@@ -0,0 +1,232 @@
+"""
+SQLite access for the API and for scripts: connection pool, schema and
+migrations, plus bulk user registration. Importing this module is cheap
+(no network, no vector store), so CLIs can use it directly.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from .auth import get_password_hash
+
+logger = logging.getLogger(__name__)
+
+SQLITE_DB = "systems_engineering.db"
+TABLES: Dict[str, str] = {
+    "knowledge": """
+        CREATE TABLE IF NOT EXISTS knowledge (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          title TEXT,
+          category TEXT,
+          source TEXT,
+          summary TEXT,
+          key_topics TEXT
+        );
+    """,
+    "ai_recommendations": """
+        CREATE TABLE IF NOT EXISTS ai_recommendations (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          query TEXT NOT NULL,
+          recommendation TEXT NOT NULL,
+          confidence_score FLOAT DEFAULT 0.95,
+          source TEXT,
+          timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+    "users": """
+        CREATE TABLE IF NOT EXISTS users (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          email TEXT UNIQUE NOT NULL,
+          hashed_password TEXT NOT NULL,
+          is_approved BOOLEAN DEFAULT 0,
+          confirmation_token TEXT,
+          is_confirmed BOOLEAN DEFAULT 0,
+          is_admin BOOLEAN DEFAULT 0,
+          name TEXT,
+          company_name TEXT
+        );
+    """,
+    "kb_files": """
+        CREATE TABLE IF NOT EXISTS kb_files (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          filename TEXT,
+          chunks INTEGER,
+          uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+}
+
+# Trigram FTS5 mirror of knowledge.key_topics: serves the same substring
+# LIKE '%q%' lookups from an index instead of a full table scan
+KNOWLEDGE_FTS: List[str] = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+      key_topics, content=knowledge, content_rowid=id, tokenize='trigram'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS knowledge_fts_ai AFTER INSERT ON knowledge BEGIN
+      INSERT INTO knowledge_fts(rowid, key_topics) VALUES (new.id, new.key_topics);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS knowledge_fts_ad AFTER DELETE ON knowledge BEGIN
+      INSERT INTO knowledge_fts(knowledge_fts, rowid, key_topics) VALUES ('delete', old.id, old.key_topics);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS knowledge_fts_au AFTER UPDATE ON knowledge BEGIN
+      INSERT INTO knowledge_fts(knowledge_fts, rowid, key_topics) VALUES ('delete', old.id, old.key_topics);
+      INSERT INTO knowledge_fts(rowid, key_topics) VALUES (new.id, new.key_topics);
+    END;
+    """,
+]
+knowledge_fts = False   # set by setup_database() if FTS5 + trigram is available
+
+INDEXES: List[str] = [
+    # users.email is already covered by its UNIQUE autoindex
+    "CREATE INDEX IF NOT EXISTS ix_users_confirmation_token ON users(confirmation_token);",
+    # partial + covering for /list_pending_users
+    "CREATE INDEX IF NOT EXISTS ix_users_pending ON users(email) WHERE is_approved=0;",
+]
+
+# users is the single account table; older DBs (e.g. the ones init_db.py /
+# fix_hash.py create) may predate any of these columns
+USER_COLUMNS: Dict[str, str] = {
+    "hashed_password": "TEXT",
+    "is_approved": "BOOLEAN DEFAULT 0",
+    "confirmation_token": "TEXT",
+    "is_confirmed": "BOOLEAN DEFAULT 0",
+    "is_admin": "BOOLEAN DEFAULT 0",
+    "name": "TEXT",
+    "company_name": "TEXT",
+}
+# accounts from the old standalone users.db (email/password/is_active/is_admin),
+# imported once; PRAGMA user_version records that it happened
+LEGACY_USERS_DB = os.getenv(
+    "LEGACY_USERS_DB", str(Path(__file__).resolve().parents[2] / "users.db")
+)
+LEGACY_USERS_IMPORTED = 1
+
+# Shared connections in autocommit + WAL mode, handed out one per request
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", 8))
+_POOL: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(SQLITE_DB, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+for _ in range(SQLITE_POOL_SIZE):
+    _POOL.put(_open_connection())
+
+@contextmanager
+def get_sqlite_connection() -> Iterator[sqlite3.Connection]:
+    conn = _POOL.get()
+    try:
+        yield conn
+    finally:
+        _POOL.put(conn)
+
+def hash_token(token: str) -> str:
+    """Confirmation tokens are stored as sha256 hex, never in the clear."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _hash_pending_tokens(conn: sqlite3.Connection) -> None:
+    """Rows written before tokens were hashed still hold the raw UUID."""
+    rows = conn.execute(
+        "SELECT id, confirmation_token FROM users "
+        "WHERE confirmation_token IS NOT NULL AND length(confirmation_token) <> 64"
+    ).fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE users SET confirmation_token=? WHERE id=?",
+            [(hash_token(tok), uid) for uid, tok in rows],
+        )
+
+def _migrate_users(conn: sqlite3.Connection) -> None:
+    have = {r[1] for r in conn.execute("PRAGMA table_info(users)")}
+    for col, decl in USER_COLUMNS.items():
+        if col not in have:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {col} {decl}")
+
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version >= LEGACY_USERS_IMPORTED or not os.path.exists(LEGACY_USERS_DB):
+        return
+    conn.execute("ATTACH DATABASE ? AS legacy", (LEGACY_USERS_DB,))
+    try:
+        # only rows holding a real passlib hash; plaintext dev rows are skipped
+        cur = conn.execute("""
+            INSERT OR IGNORE INTO users (email, hashed_password, is_approved, is_confirmed, is_admin)
+            SELECT lower(email), password, is_active, is_active, is_admin
+            FROM legacy.users WHERE password LIKE '$%'
+        """)
+        if cur.rowcount > 0:
+            logger.info("Imported %d users from %s", cur.rowcount, LEGACY_USERS_DB)
+    except sqlite3.OperationalError as exc:
+        logger.warning("Skipping legacy users import: %s", exc)
+    finally:
+        conn.execute("DETACH DATABASE legacy")
+    conn.execute(f"PRAGMA user_version = {LEGACY_USERS_IMPORTED}")
+
+def fts_available() -> bool:
+    return knowledge_fts
+
+def setup_database() -> None:
+    global knowledge_fts
+    with get_sqlite_connection() as conn:
+        for ddl in TABLES.values():
+            conn.execute(ddl)
+        _migrate_users(conn)
+        _hash_pending_tokens(conn)
+        for ddl in INDEXES:
+            conn.execute(ddl)
+        fresh = not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='knowledge_fts'"
+        ).fetchone()
+        try:
+            for ddl in KNOWLEDGE_FTS:
+                conn.execute(ddl)
+            if fresh:
+                conn.execute("INSERT INTO knowledge_fts(knowledge_fts) VALUES ('rebuild')")
+            knowledge_fts = True
+        except sqlite3.OperationalError as exc:   # SQLite < 3.34 / no FTS5
+            logger.warning("knowledge FTS unavailable, using LIKE scans: %s", exc)
+
+def bulk_register(users: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    Register many (email, password) pairs in one transaction, for seed
+    scripts and migrations (call it under `if __name__ == "__main__":`).
+    Creates the schema if needed; hashes run in parallel worker processes.
+    Returns (email, confirmation_token) pairs; all-or-nothing on duplicates.
+    """
+    setup_database()
+    emails = [e.lower() for e, _ in users]
+    with ProcessPoolExecutor() as pool:
+        hashes = list(pool.map(get_password_hash, [p for _, p in users]))
+    tokens = [str(uuid.uuid4()) for _ in users]
+    with get_sqlite_connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO users (email,hashed_password,is_approved,confirmation_token,is_confirmed) VALUES (?,?,0,?,0)",
+                [(e, h, hash_token(t)) for e, h, t in zip(emails, hashes, tokens)],
+            )
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return list(zip(emails, tokens))
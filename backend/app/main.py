@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import hmac
+import json
 import logging
-import math
-import mimetypes
 import os
 import sqlite3
+import tempfile
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from io import BytesIO
 from typing import Dict, List, Optional
 
 import requests
@@ -20,12 +24,14 @@ from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
 from openai import OpenAI
 from pydantic import BaseModel, EmailStr
-from pypdf import PdfReader
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 
-# Local helpers (auth, vector store)
-from .auth          import create_access_token, verify_password, get_password_hash, require_token
+# Local helpers (auth, db, vector store)
+from .auth          import (create_access_token, get_password_hash, require_token,
+                            verify_and_update_password)
+from .pdf_text     import extract_text
+from .db           import fts_available, get_sqlite_connection, hash_token, setup_database
 from .vector_store import VectorStore
 
 # ───────────────────────── Setup ────────────────────────────
@@ -43,9 +49,12 @@ logger.info("🔑 Loaded NASA key: %s", bool(NASA_API_KEY))
 app = FastAPI(title="AI Systems Engineering Agent", version="0.2.1")
 
 @app.on_event("startup")
-async def startup_rate_limiter() -> None:
+async def startup() -> None:
     redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
     await FastAPILimiter.init(redis)
+    app.state.redis = redis
+    setup_database()
+    await asyncio.to_thread(_populate_vector_store)
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,73 +73,17 @@ app.mount("/reports", StaticFiles(directory="reports"), name="reports")
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-# ─────────────────────── Database (SQLite) ─────────────────────
-SQLITE_DB = "systems_engineering.db"
-TABLES: Dict[str, str] = {
-    "knowledge": """
-        CREATE TABLE IF NOT EXISTS knowledge (
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          title TEXT,
-          category TEXT,
-          source TEXT,
-          summary TEXT,
-          key_topics TEXT
-        );
-    """,
-    "ai_recommendations": """
-        CREATE TABLE IF NOT EXISTS ai_recommendations (
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          query TEXT NOT NULL,
-          recommendation TEXT NOT NULL,
-          confidence_score FLOAT DEFAULT 0.95,
-          source TEXT,
-          timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
-    "users": """
-        CREATE TABLE IF NOT EXISTS users (
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          email TEXT UNIQUE NOT NULL,
-          hashed_password TEXT NOT NULL,
-          is_approved BOOLEAN DEFAULT 0,
-          confirmation_token TEXT,
-          is_confirmed BOOLEAN DEFAULT 0
-        );
-    """,
-    "kb_files": """
-        CREATE TABLE IF NOT EXISTS kb_files (
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          filename TEXT,
-          chunks INTEGER,
-          uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-    """,
-}
-
-def get_sqlite_connection() -> sqlite3.Connection:
-    return sqlite3.connect(SQLITE_DB, check_same_thread=False)
-
-def setup_database() -> None:
-    with get_sqlite_connection() as conn:
-        for ddl in TABLES.values():
-            conn.execute(ddl)
-        conn.commit()
-
-setup_database()
-
 # ───────────────────── FAISS Vector Store ─────────────────────
 vector_store = VectorStore()
 
 def _populate_vector_store() -> None:
     with get_sqlite_connection() as conn:
-        for (summary,) in conn.execute("SELECT summary FROM knowledge"):
-            if summary:
-                vector_store.add_text(summary)
+        rows = conn.execute("SELECT summary FROM knowledge WHERE summary <> ''").fetchall()
+    texts = [s for (s,) in rows]
+    vector_store.add_texts(texts)
     # use ntotal or ids length instead of len()
     logger.info("Vector store pre-loaded with %d summaries", vector_store.index.ntotal)
 
-_populate_vector_store()
-
 # ───────────────────────── Models ──────────────────────────
 class ConsultRequest(BaseModel):
     user_question: str
@@ -157,51 +110,106 @@ class LoginRequest(BaseModel):
     password: str
 
 # ───────────────────────── Helpers ─────────────────────────
+# fallback answers that must not be cached (fixable by config or a retry)
+NASA_FAILED      = "NASA API request failed."
+NASA_MISSING_KEY = "🔑 NASA_API_KEY missing."
+
 def fetch_nasa_data(q: str) -> str:
     if not NASA_API_KEY:
-        return "🔑 NASA_API_KEY missing."
+        return NASA_MISSING_KEY
     url = f"https://api.nasa.gov/techport/api/projects?search={q}&api_key={NASA_API_KEY}"
     try:
-        projects = requests.get(url, timeout=30).json().get("projects", [])
+        resp = requests.get(url, timeout=30)
+        resp.raise_for_status()  # 429/5xx error bodies aren't "no data"
+        projects = resp.json().get("projects", [])
         return projects[0].get("title", "No NASA data found.") if projects else "No NASA data."
     except Exception as exc:
         logger.error("NASA API error: %s", exc)
-        return "NASA API request failed."
+        return NASA_FAILED
 
 def search_knowledge(q: str) -> Optional[str]:
+    sql = (
+        "SELECT k.summary FROM knowledge_fts f JOIN knowledge k ON k.id = f.rowid "
+        "WHERE f.key_topics LIKE ? LIMIT 1"
+        if fts_available() else
+        "SELECT summary FROM knowledge WHERE key_topics LIKE ?"
+    )
     with get_sqlite_connection() as conn:
-        row = conn.execute(
-            "SELECT summary FROM knowledge WHERE key_topics LIKE ?",
-            (f"%{q}%",)
-        ).fetchone()
+        row = conn.execute(sql, (f"%{q}%",)).fetchone()
         return row[0] if row else None
 
-MAX_TOKENS = 800
+# Redis read-through cache for the per-question context lookups
+KB_CACHE_TTL   = int(os.getenv("KB_CACHE_TTL", 3600))
+NASA_CACHE_TTL = int(os.getenv("NASA_CACHE_TTL", 86400))
+
+async def _cached(prefix: str, ttl: int, fn, q: str, keep=lambda v: True):
+    key = f"{prefix}:{q.lower()}"
+    hit = await app.state.redis.get(key)
+    if hit is not None:
+        return json.loads(hit)
+    val = await asyncio.to_thread(fn, q)
+    if keep(val):
+        await app.state.redis.setex(key, ttl, json.dumps(val))
+    return val
 
-def approx_tokens(n_words: int) -> int:
-    return math.ceil(n_words * 0.75)
+async def cached_search_knowledge(q: str) -> Optional[str]:
+    return await _cached("kb", KB_CACHE_TTL, search_knowledge, q)
+
+async def cached_nasa(q: str) -> str:
+    return await _cached("nasa", NASA_CACHE_TTL, fetch_nasa_data, q,
+                         keep=lambda v: v not in (NASA_FAILED, NASA_MISSING_KEY))
+
+MAX_TOKENS = 800
 
 def _token_chunks(text: str, max_tokens: int = MAX_TOKENS) -> List[str]:
-    words, chunk, chunks = text.split(), [], []
-    for w in words:
-        if approx_tokens(len(chunk) + 1) > max_tokens:
-            chunks.append(" ".join(chunk)); chunk = []
-        chunk.append(w)
-    if chunk:
-        chunks.append(" ".join(chunk))
-    return chunks
-
-def _extract_text(raw: bytes, fname: str) -> str:
-    mime, _ = mimetypes.guess_type(fname)
-    if mime == "application/pdf":
-        return "\n".join((p.extract_text() or "") for p in PdfReader(BytesIO(raw)).pages)
-    return raw.decode("utf-8", errors="ignore")
+    # tokens are estimated at 0.75 per word, so every chunk but the last holds
+    # the same word count: the largest n with ceil(n * 0.75) <= max_tokens
+    words = text.split()
+    step = max(1, max_tokens * 4 // 3)
+    return [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+# Uploads are streamed in chunks, never held whole as bytes
+UPLOAD_CHUNK = 1 << 20
+
+async def _save_upload(file: UploadFile) -> str:
+    """Copy an upload to a temp file (by path, so PDF workers can open it). Caller unlinks."""
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK):
+                tmp.write(chunk)
+        except BaseException:
+            # caller's cleanup only starts once we return the path
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return tmp.name
+
+async def _read_upload_text(file: UploadFile) -> str:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+    while chunk := await file.read(UPLOAD_CHUNK):
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+# Password hashing is CPU-bound (argon2/bcrypt); run it off the event loop
+# in worker processes so it scales past the GIL
+_HASH_POOL = ProcessPoolExecutor(max_workers=int(os.getenv("HASH_WORKERS", os.cpu_count() or 1)))
+
+async def _in_hash_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_HASH_POOL, fn, *args)
 
 # ──────────────────── GPT-4 Consultant ────────────────────
-def ask_expert_system(question: str, industry: str, role: str) -> str:
-    kb_match = search_knowledge(question) or "None"
-    nasa = fetch_nasa_data(question)
-    mem_ctx = "\n".join(f"- {m}" for m in vector_store.search(question, 3)) or "None"
+async def ask_expert_system(question: str, industry: str, role: str) -> str:
+    # independent context lookups: wait for the slowest, not the sum
+    kb_match, nasa, memories = await asyncio.gather(
+        cached_search_knowledge(question),
+        cached_nasa(question),
+        asyncio.to_thread(vector_store.search, question, 3),
+    )
+    kb_match = kb_match or "None"
+    mem_ctx = "\n".join(f"- {m}" for m in memories) or "None"
     system_prompt = (
         f"You are a senior systems engineering consultant specialized in {role}.\n"
         "Provide a structured answer (Introduction, Analysis, Recommendations, …)."
@@ -211,7 +219,8 @@ def ask_expert_system(question: str, industry: str, role: str) -> str:
         f"- Knowledge Base: {kb_match}\n- Related Memories:\n{mem_ctx}\n"
         f"- NASA Research: {nasa}\n"
     )
-    resp = client.chat.completions.create(
+    resp = await asyncio.to_thread(
+        client.chat.completions.create,
         model="gpt-4",
         messages=[{"role": "system", "content": system_prompt + "\n\n" + user_prompt}],
         timeout=60,
@@ -258,35 +267,54 @@ def agent_decide(
     return {"tool": tool, "input": query, "result": fn(query)}
 
 # ───────────────────────── Auth Endpoints ──────────────────────────
-@app.post("/register")
-def register_user(req: RegisterRequest):
-    token = str(uuid.uuid4())
+# Blocking DB parts of the async auth handlers; run via asyncio.to_thread so
+# waiting on the connection pool never stalls the event loop
+def _insert_user(email: str, hashed: str, token: str) -> bool:
+    """False if the email is already registered."""
     with get_sqlite_connection() as conn:
         try:
             conn.execute(
                 "INSERT INTO users (email,hashed_password,is_approved,confirmation_token,is_confirmed) VALUES (?,?,?,?,0)",
-                (req.email.lower(), get_password_hash(req.password), 0, token),
+                (email, hashed, 0, hash_token(token)),
             )
-            conn.commit()
         except sqlite3.IntegrityError:
-            raise HTTPException(400, "Email already registered.")
+            return False
+    return True
+
+def _fetch_login_row(email: str):
+    with get_sqlite_connection() as conn:
+        return conn.execute(
+            "SELECT id,hashed_password,is_approved,is_confirmed FROM users WHERE email=?",
+            (email,),
+        ).fetchone()
+
+def _update_password_hash(user_id: int, hashed: str) -> None:
+    with get_sqlite_connection() as conn:
+        conn.execute("UPDATE users SET hashed_password=? WHERE id=?", (hashed, user_id))
+
+@app.post("/register")
+async def register_user(req: RegisterRequest):
+    token = str(uuid.uuid4())
+    hashed = await _in_hash_pool(get_password_hash, req.password)
+    if not await asyncio.to_thread(_insert_user, req.email.lower(), hashed, token):
+        raise HTTPException(400, "Email already registered.")
     logger.info("Email confirmation link: /confirm_email?token=%s", token)
     return {"message": "Registered. Check server log for confirmation link."}
 
 @app.get("/confirm_email")
 def confirm_email(token: str = Query(...)):
+    token_hash = hash_token(token)
     with get_sqlite_connection() as conn:
         row = conn.execute(
-            "SELECT id FROM users WHERE confirmation_token=? AND is_confirmed=0",
-            (token,),
+            "SELECT id,confirmation_token FROM users WHERE confirmation_token=? AND is_confirmed=0",
+            (token_hash,),
         ).fetchone()
-        if not row:
+        if not row or not hmac.compare_digest(row[1], token_hash):
             raise HTTPException(404, "Invalid or used token.")
         conn.execute(
             "UPDATE users SET is_confirmed=1, confirmation_token=NULL WHERE id=?",
             (row[0],),
         )
-        conn.commit()
     return {"message": f"Email confirmed for user {row[0]}. Awaiting admin approval."}
 
 @app.post("/approve_user")
@@ -296,7 +324,6 @@ def approve_user(req: ApproveRequest, payload=Depends(require_token)):
                            (1 if req.approve else 0, req.user_id))
         if cur.rowcount == 0:
             raise HTTPException(404, "User not found.")
-        conn.commit()
     return {"message": f"User {req.user_id} {'approved' if req.approve else 'unapproved'}."}
 
 @app.get("/list_pending_users")
@@ -306,40 +333,63 @@ def list_pending_users(payload=Depends(require_token)):
     return [{"id": r[0], "email": r[1]} for r in rows]
 
 @app.post("/login")
-def login(req: LoginRequest):
-    with get_sqlite_connection() as conn:
-        row = conn.execute(
-            "SELECT id,hashed_password,is_approved,is_confirmed FROM users WHERE email=?",
-            (req.email.lower(),),
-        ).fetchone()
-        if not row or not verify_password(req.password, row[1]):
-            raise HTTPException(401, "Invalid credentials.")
-        if not (row[2] and row[3]):
-            raise HTTPException(403, "Account not confirmed or approved.")
+async def login(req: LoginRequest):
+    row = await asyncio.to_thread(_fetch_login_row, req.email.lower())
+    if not row:
+        raise HTTPException(401, "Invalid credentials.")
+    ok, new_hash = await _in_hash_pool(verify_and_update_password, req.password, row[1])
+    if not ok:
+        raise HTTPException(401, "Invalid credentials.")
+    if new_hash:
+        # lazily migrate bcrypt → argon2id
+        await asyncio.to_thread(_update_password_hash, row[0], new_hash)
+    if not (row[2] and row[3]):
+        raise HTTPException(403, "Account not confirmed or approved.")
     return {"access_token": create_access_token({"sub": str(row[0])})}
 
 # ─────────────────── Protected AI/LLM Routes ───────────────────
-uploaded_specs: Dict[str, str] = {}
+# Uploaded document text lives in Redis (shared by all workers, expires
+# after DOC_TTL); the "docs" sorted set indexes ids by expiry time
+DOC_TTL = int(os.getenv("DOC_TTL", 86400))
+
+async def store_doc(doc_id: str, text: str) -> None:
+    expires = time.time() + DOC_TTL
+    async with app.state.redis.pipeline(transaction=True) as pipe:
+        pipe.set(f"doc:{doc_id}", text, ex=DOC_TTL)
+        pipe.zadd("docs", {doc_id: expires})
+        await pipe.execute()
+
+async def load_docs(doc_ids: List[str]) -> List[Optional[str]]:
+    if not doc_ids:
+        return []
+    return await app.state.redis.mget([f"doc:{d}" for d in doc_ids])
+
+async def list_docs() -> List[str]:
+    r = app.state.redis
+    await r.zremrangebyscore("docs", "-inf", time.time())
+    return await r.zrange("docs", 0, -1)
 
 @app.post("/consult")
-def consult(req: ConsultRequest, payload=Depends(require_token)):
-    answer = ask_expert_system(req.user_question, req.industry, req.role)
-    return {"answer": answer, "report": generate_pdf_report(req.user_question, answer)}
+async def consult(req: ConsultRequest, payload=Depends(require_token)):
+    answer = await ask_expert_system(req.user_question, req.industry, req.role)
+    report = await asyncio.to_thread(generate_pdf_report, req.user_question, answer)
+    return {"answer": answer, "report": report}
 
 @app.get("/list_uploaded_docs")
-def list_uploaded_docs(payload=Depends(require_token)):
-    return list(uploaded_specs.keys())
+async def list_uploaded_docs(payload=Depends(require_token)):
+    return await list_docs()
 
 @app.post("/upload_specs")
 async def upload_specs(file: UploadFile = File(...), payload=Depends(require_token)):
-    text = (await file.read()).decode("utf-8", errors="ignore")
-    uploaded_specs[file.filename] = text
-    vector_store.add_text(text)
+    text = await _read_upload_text(file)
+    await store_doc(file.filename, text)
+    await asyncio.to_thread(vector_store.add_text, text)
     return {"filename": file.filename, "status": "Uploaded", "length": len(text)}
 
 @app.post("/deep_dive")
 async def deep_dive(req: DeepDiveRequest, payload=Depends(require_token)):
-    specs = "\n".join(uploaded_specs.get(doc_id, "") for doc_id in req.uploaded_doc_ids).strip()
+    docs = await load_docs(req.uploaded_doc_ids)
+    specs = "\n".join(d or "" for d in docs).strip()
     if not specs:
         raise HTTPException(404, "Specs not found.")
     prompt = (
@@ -347,7 +397,8 @@ async def deep_dive(req: DeepDiveRequest, payload=Depends(require_token)):
         f"Objectives: {req.objectives}\nConstraints: {req.constraints}\n\n"
         f"Specs Provided:\n{specs[:4000]}..."
     )
-    resp = client.chat.completions.create(
+    resp = await asyncio.to_thread(
+        client.chat.completions.create,
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a systems engineering consultant."},
@@ -356,23 +407,27 @@ async def deep_dive(req: DeepDiveRequest, payload=Depends(require_token)):
         timeout=120,
     )
     answer = resp.choices[0].message.content
-    return {"answer": answer, "report": generate_pdf_report(req.objectives, answer), "summary": answer[:250] + "…"}
+    report = await asyncio.to_thread(generate_pdf_report, req.objectives, answer)
+    return {"answer": answer, "report": report, "summary": answer[:250] + "…"}
+
+def _record_kb_file(filename: str, chunks: int) -> None:
+    with get_sqlite_connection() as conn:
+        conn.execute("INSERT INTO kb_files (filename,chunks) VALUES (?,?)", (filename, chunks))
 
 @app.post("/upload_knowledge_base")
 async def upload_kb(file: UploadFile = File(...), payload=Depends(require_token)):
-    raw = await file.read()
-    text = _extract_text(raw, file.filename)
+    path = await _save_upload(file)
+    try:
+        text = await asyncio.to_thread(extract_text, path, file.filename)
+    finally:
+        os.unlink(path)
     if not text.strip():
         raise HTTPException(400, "Unable to extract text.")
     chunks = _token_chunks(text)
-    for ch in chunks:
-        vector_store.add_text(ch)
+    await asyncio.to_thread(vector_store.add_texts, chunks)
     doc_id = str(uuid.uuid4())
-    uploaded_specs[doc_id] = text
-    with get_sqlite_connection() as conn:
-        conn.execute("INSERT INTO kb_files (filename,chunks) VALUES (?,?)",
-                     (file.filename, len(chunks)))
-        conn.commit()
+    await store_doc(doc_id, text)
+    await asyncio.to_thread(_record_kb_file, file.filename, len(chunks))
     return {"status": "indexed", "doc_id": doc_id, "filename": file.filename, "chunks": len(chunks)}
 
 @app.get("/")
@@ -0,0 +1,59 @@
+"""
+Text extraction for uploaded files. Kept free of import-time side effects:
+its functions run in worker processes, which re-import this module under
+the spawn / forkserver start methods.
+"""
+
+from __future__ import annotations
+
+import math
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from pypdf import PdfReader
+
+try:
+    import fitz  # pymupdf: C text extraction, much faster than pypdf
+except ImportError:
+    fitz = None
+
+# Big PDFs are split into page ranges across processes; with pymupdf the
+# per-page cost is low enough that only very large files are worth it
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(8, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = 200 if fitz else 16
+
+@lru_cache(maxsize=1)
+def _pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS)
+
+def _pdf_page_count(path: str) -> int:
+    if fitz is not None:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    return len(PdfReader(path).pages)
+
+def _extract_pages(args) -> str:
+    path, start, stop = args
+    if fitz is not None:
+        with fitz.open(path) as doc:
+            return "\n".join(doc[i].get_text("text") for i in range(start, stop))
+    pages = PdfReader(path).pages
+    return "\n".join((pages[i].extract_text() or "") for i in range(start, stop))
+
+def _extract_pdf(path: str) -> str:
+    n = _pdf_page_count(path)
+    if n < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        return _extract_pages((path, 0, n))
+    step = math.ceil(n / PDF_WORKERS)
+    spans = [(path, i, min(i + step, n)) for i in range(0, n, step)]
+    return "\n".join(_pool().map(_extract_pages, spans))
+
+def extract_text(path: str, fname: str) -> str:
+    """Plain text of the file at `path`; `fname` (the upload name) picks the format."""
+    mime, _ = mimetypes.guess_type(fname)
+    if mime == "application/pdf":
+        return _extract_pdf(path)
+    with open(path, encoding="utf-8", errors="ignore", newline="") as f:
+        return f.read()
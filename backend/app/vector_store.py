@@ -1,6 +1,10 @@
 import os
 import json
 import uuid
+import hashlib
+import sqlite3
+import threading
+import atexit
 from typing import List, Dict, Any, Optional
 
 import numpy as np
@@ -10,13 +14,31 @@ from openai import OpenAI
 # ————— Configuration —————
 EMBEDDING_MODEL = "text-embedding-ada-002"
 INDEX_PATH       = "vector_store.index"
-META_PATH        = "vector_store_meta.json"
+META_PATH        = "vector_meta.db"
+LEGACY_META_PATH = "vector_store_meta.json"   # imported once, then renamed to *.imported
+EMBED_CACHE_PATH = "embed_cache.db"
+SQLITE_MAX_VARS  = 500   # keep IN (...) lists well under SQLite's limit
+SAVE_EVERY       = int(os.getenv("FAISS_SAVE_EVERY", 1000))  # adds between index writes
+EMBED_MAX_INPUTS = 2048      # OpenAI limit on inputs per embeddings request
+EMBED_MAX_TOKENS = 250_000   # stay under the per-request token cap (300k)
+
+# FAISS index type: "flat" (brute force), "hnsw" (graph) or "ivf" (clustered)
+INDEX_TYPE       = os.getenv("FAISS_INDEX", "hnsw")
+HNSW_M           = int(os.getenv("FAISS_HNSW_M", 32))
+HNSW_EF_SEARCH   = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+HNSW_MIN         = int(os.getenv("FAISS_HNSW_MIN", 5000))  # stay flat below this size
+IVF_NLIST        = int(os.getenv("FAISS_IVF_NLIST", 100))
+IVF_NPROBE       = int(os.getenv("FAISS_IVF_NPROBE", 8))
+IVF_TRAIN_FACTOR = 39    # FAISS wants ≥39 training points per centroid
 
 
 class VectorStore:
     """
     A FAISS-backed vector store with on-disk persistence.
-    - add_text / add_texts
+    Metadata rows live in SQLite and are committed on every add, whatever
+    `persist` says; only the FAISS index write is deferred: it happens every
+    SAVE_EVERY adds, on flush() and at interpreter exit.
+    - add_text / add_texts (+ flush for deferred index saves)
     - search → returns id, text, metadata, score
     - delete / clear
     - len(vector_store) → number of entries
@@ -28,26 +50,111 @@ class VectorStore:
         embedding_model: str = EMBEDDING_MODEL,
         index_path: str = INDEX_PATH,
         meta_path:  str = META_PATH,
+        cache_path: str = EMBED_CACHE_PATH,
+        index_type: str = INDEX_TYPE,
     ):
         # OpenAI client
         self.client = client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model  = embedding_model
 
+        # content-hash → normalized vector cache, survives restarts
+        self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+        self._cache.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (k BLOB PRIMARY KEY, v BLOB NOT NULL)"
+        )
+        self._cache_lock = threading.Lock()
+
         # FAISS index: inner-product on normalized vectors → cosine similarity
         self.dim   = self._fetch_embedding_dimension()
-        self.index = faiss.IndexFlatIP(self.dim)
+        self.index_type = index_type
+        self.index = self._new_index()
 
         # persistence paths
         self.index_path = index_path
         self.meta_path  = meta_path
 
-        # in-RAM metadata: parallel lists of IDs and their text+metadata
-        self.ids: List[str] = []
-        self.meta: Dict[str, Dict[str, Any]] = {}
+        # metadata: one row per entry, UUID ↔ int64 FAISS id + text + metadata
+        self._mdb = sqlite3.connect(meta_path, check_same_thread=False)
+        self._mdb.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " id TEXT PRIMARY KEY, fid INTEGER UNIQUE NOT NULL,"
+            " text TEXT NOT NULL, metadata TEXT NOT NULL DEFAULT '{}')"
+        )
+        self._mdb_lock = threading.Lock()
+        self._unsaved = 0
+        # guards self.index, next_fid and _unsaved: adds run in worker threads,
+        # and FAISS drops the GIL inside add/remove/search. Taken before _mdb_lock.
+        self._index_lock = threading.RLock()
 
-        # try loading existing index + metadata
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
+        # try loading existing index (+ legacy JSON metadata)
+        if os.path.exists(self.index_path):
             self._load()
+        (max_fid,) = self._mdb.execute("SELECT MAX(fid) FROM meta").fetchone()
+        self.next_fid = 0 if max_fid is None else max_fid + 1
+
+        atexit.register(self.flush)
+
+    def _new_index(self) -> faiss.Index:
+        """
+        Empty flat index wrapped in an id map. Every type starts here and is
+        swapped for HNSW / IVF once it grows large enough (_maybe_upgrade).
+        """
+        return faiss.index_factory(self.dim, "IDMap2,Flat", faiss.METRIC_INNER_PRODUCT)
+
+    def _build(self, vecs: np.ndarray, fids: np.ndarray) -> faiss.Index:
+        """
+        Index of the right kind for len(vecs) entries, filled with them.
+        - hnsw: IDMap2 over an HNSW graph. HNSW can't drop nodes, so each
+          delete rebuilds the whole graph; below HNSW_MIN entries we stay
+          flat where deletes are cheap.
+        - ivf: a plain IVF index, which keeps ids itself and supports
+          remove_ids directly (an IDMap2 wrapper would not).
+        """
+        n = len(vecs)
+        if self.index_type == "hnsw" and n >= HNSW_MIN:
+            desc = f"IDMap2,HNSW{HNSW_M}"
+        elif self.index_type == "ivf" and n >= IVF_NLIST * IVF_TRAIN_FACTOR:
+            desc = f"IVF{IVF_NLIST},Flat"
+        else:
+            desc = "IDMap2,Flat"
+        index = faiss.index_factory(self.dim, desc, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(vecs)
+        if n:
+            index.add_with_ids(vecs, fids)
+        self._tune(index)
+        return index
+
+    @staticmethod
+    def _tune(index: faiss.Index) -> None:
+        """Apply search-time knobs (not all of them survive write_index)."""
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = IVF_NPROBE
+            return
+        sub = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        if isinstance(sub, faiss.IndexHNSW):
+            sub.hnsw.efSearch = HNSW_EF_SEARCH
+
+    def _dump(self):
+        """Return (vectors, fids) for every entry of an id-mapped index."""
+        n = self.index.ntotal
+        vecs = self.index.index.reconstruct_n(0, n)
+        fids = faiss.vector_to_array(self.index.id_map).astype("int64")
+        return vecs, fids
+
+    def _is_flat(self) -> bool:
+        return (hasattr(self.index, "id_map")
+                and isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlat))
+
+    def _maybe_upgrade(self) -> None:
+        """Swap the flat index for HNSW / IVF once it crosses the size threshold."""
+        if self.index_type == "flat" or not self._is_flat():
+            return
+        n = self.index.ntotal
+        if n < (HNSW_MIN if self.index_type == "hnsw" else IVF_NLIST * IVF_TRAIN_FACTOR):
+            return
+        self.index = self._build(*self._dump())
 
     def _fetch_embedding_dimension(self) -> int:
         """Probe the model on a dummy input to get dimensionality."""
@@ -57,13 +164,72 @@ class VectorStore:
         )
         return len(resp.data[0].embedding)
 
+    def _cache_key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).digest()
+
+    def _cache_get(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up cached vectors; returns only the hits."""
+        hits: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._cache_lock:
+            for i in range(0, len(unique), SQLITE_MAX_VARS):
+                batch = unique[i:i + SQLITE_MAX_VARS]
+                marks = ",".join("?" * len(batch))
+                rows = self._cache.execute(
+                    f"SELECT k, v FROM embeddings WHERE k IN ({marks})", batch
+                )
+                for k, v in rows:
+                    hits[bytes(k)] = np.frombuffer(v, dtype=np.float32)
+        return hits
+
+    def _cache_put(self, items: Dict[bytes, np.ndarray]) -> None:
+        with self._cache_lock, self._cache:
+            self._cache.executemany(
+                "INSERT OR IGNORE INTO embeddings (k, v) VALUES (?, ?)",
+                [(k, v.tobytes()) for k, v in items.items()],
+            )
+
     def _embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Return a (N×dim) float32 normalized array for `texts`.
+        Cached vectors are reused; only misses go to OpenAI.
+        """
+        keys = [self._cache_key(t) for t in texts]
+        vecs = self._cache_get(keys)
+        misses = list(dict.fromkeys(
+            (k, t) for k, t in zip(keys, texts) if k not in vecs
+        ))
+        if misses:
+            fresh = self._embed_remote([t for _, t in misses])
+            new = {k: fresh[i] for i, (k, _) in enumerate(misses)}
+            self._cache_put(new)
+            vecs.update(new)
+        return np.vstack([vecs[k] for k in keys])
+
+    @staticmethod
+    def _batches(texts: List[str]):
+        """Yield (start, stop) slices within the per-request input/token limits."""
+        start, tokens = 0, 0
+        for i, t in enumerate(texts):
+            n = len(t) // 3 + 1   # rough token estimate, errs high
+            if i > start and (i - start >= EMBED_MAX_INPUTS or tokens + n > EMBED_MAX_TOKENS):
+                yield start, i
+                start, tokens = i, 0
+            tokens += n
+        if start < len(texts):
+            yield start, len(texts)
+
+    def _embed_remote(self, texts: List[str]) -> np.ndarray:
         """Batch-embed via OpenAI and return a (N×dim) float32 normalized array."""
-        resp = self.client.embeddings.create(model=self.model, input=texts)
-        arr = np.array([e.embedding for e in resp.data], dtype=np.float32)
-        # normalize rows for cosine-sim
-        norms = np.linalg.norm(arr, axis=1, keepdims=True)
-        return arr / (norms + 1e-12)
+        # fill a preallocated buffer row by row (no list-of-lists copy)
+        arr = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start, stop in self._batches(texts):
+            resp = self.client.embeddings.create(model=self.model, input=texts[start:stop])
+            for e in resp.data:
+                arr[start + e.index] = e.embedding
+        # normalize rows in place for cosine-sim (single SIMD pass)
+        faiss.normalize_L2(arr)
+        return arr
 
     def add_text(
         self,
@@ -75,19 +241,7 @@ class VectorStore:
         Embed `text`, add to FAISS, record metadata.
         Returns the generated UUID.
         """
-        emb = self._embed([text])[0]              # shape (dim,)
-        self.index.add(emb.reshape(1, -1))        # add to FAISS
-
-        entry_id = str(uuid.uuid4())
-        self.ids.append(entry_id)
-        self.meta[entry_id] = {
-            "text": text,
-            "metadata": metadata or {},
-        }
-
-        if persist:
-            self._save()
-        return entry_id
+        return self.add_texts([text], [metadata or {}], persist=persist)[0]
 
     def add_texts(
         self,
@@ -96,23 +250,30 @@ class VectorStore:
         persist: bool = True,
     ) -> List[str]:
         """
-        Batch-add multiple texts. Returns list of UUIDs.
+        Batch-add multiple texts with a single embeddings call.
+        Returns list of UUIDs. The metadata rows are committed right away;
+        with persist=False the FAISS index is not written until flush().
         """
+        if not texts:
+            return []
         embs = self._embed(texts)  # shape (N,dim)
-        self.index.add(embs)
-
-        ids: List[str] = []
-        for i, txt in enumerate(texts):
-            eid = str(uuid.uuid4())
-            ids.append(eid)
-            self.ids.append(eid)
-            self.meta[eid] = {
-                "text": txt,
-                "metadata": (metadatas[i] if metadatas else {}),
-            }
-
-        if persist:
-            self._save()
+        ids = [str(uuid.uuid4()) for _ in texts]
+        with self._index_lock:
+            fids = np.arange(self.next_fid, self.next_fid + len(texts), dtype="int64")
+            self.index.add_with_ids(embs, fids)
+            self.next_fid += len(texts)
+            self._maybe_upgrade()
+
+            rows = [
+                (eid, int(fid), txt, json.dumps(metadatas[i] if metadatas else {}, ensure_ascii=False))
+                for i, (eid, fid, txt) in enumerate(zip(ids, fids, texts))
+            ]
+            with self._mdb_lock, self._mdb:
+                self._mdb.executemany("INSERT INTO meta VALUES (?,?,?,?)", rows)
+
+            self._unsaved += len(texts)
+            if persist and self._unsaved >= SAVE_EVERY:
+                self._save()
         return ids
 
     def search(
@@ -128,55 +289,76 @@ class VectorStore:
             return []
 
         q_emb = self._embed([query])               # (1,dim)
-        scores, idxs = self.index.search(q_emb, k) # both (1,k)
+        with self._index_lock:
+            scores, fids = self.index.search(q_emb, k) # both (1,k)
+        hits = [(int(f), float(sc)) for f, sc in zip(fids[0], scores[0]) if f >= 0]
+        if not hits:
+            return []
+
+        marks = ",".join("?" * len(hits))
+        with self._mdb_lock:
+            rows = self._mdb.execute(
+                f"SELECT fid, id, text, metadata FROM meta WHERE fid IN ({marks})",
+                [f for f, _ in hits],
+            ).fetchall()
+        by_fid = {r[0]: r for r in rows}
+
         results: List[Dict[str, Any]] = []
-        for score, idx in zip(scores[0], idxs[0]):
-            if idx < 0 or idx >= len(self.ids):
+        for fid, score in hits:
+            row = by_fid.get(fid)
+            if row is None:
                 continue
-            eid = self.ids[idx]
-            entry = self.meta[eid]
             results.append({
-                "id": eid,
-                "text": entry["text"],
-                "metadata": entry["metadata"],
-                "score": float(score),
+                "id": row[1],
+                "text": row[2],
+                "metadata": json.loads(row[3]),
+                "score": score,
             })
         return results
 
     def delete(self, entry_id: str, persist: bool = True) -> bool:
         """
-        Remove a single entry by its ID by rebuilding the index.
+        Remove a single entry by its ID. Flat and IVF indexes drop it in
+        place; an HNSW index is rebuilt from the remaining vectors.
         Returns True if deleted.
         """
-        if entry_id not in self.ids:
-            return False
-
-        # build new list without that entry
-        keep = [(i, eid) for i, eid in enumerate(self.ids) if eid != entry_id]
-        new_embs: List[np.ndarray] = []
-        new_ids: List[str] = []
-        for _, eid in keep:
-            vec = self.index.reconstruct(self.ids.index(eid))
-            new_embs.append(vec)
-            new_ids.append(eid)
-
-        # rebuild index
-        self.index.reset()
-        self.index.add(np.vstack(new_embs))
-        self.ids = new_ids
-        self.meta.pop(entry_id, None)
-
-        if persist:
-            self._save()
+        with self._index_lock:
+            with self._mdb_lock:
+                row = self._mdb.execute("SELECT fid FROM meta WHERE id=?", (entry_id,)).fetchone()
+            if row is None:
+                return False
+            fid = row[0]
+
+            try:
+                self.index.remove_ids(np.array([fid], dtype="int64"))
+            except RuntimeError:
+                # HNSW graphs can't drop nodes: rebuild from what's left
+                vecs, fids = self._dump()
+                keep = fids != fid
+                self.index = self._build(vecs[keep], fids[keep])
+            with self._mdb_lock, self._mdb:
+                self._mdb.execute("DELETE FROM meta WHERE id=?", (entry_id,))
+
+            self._unsaved += 1
+            if persist:
+                self._save()
         return True
 
     def clear(self, persist: bool = True) -> None:
         """Remove all entries."""
-        self.index.reset()
-        self.ids.clear()
-        self.meta.clear()
-        if persist:
-            self._save()
+        with self._index_lock:
+            self.index = self._new_index()
+            with self._mdb_lock, self._mdb:
+                self._mdb.execute("DELETE FROM meta")
+            self._unsaved += 1
+            if persist:
+                self._save()
+
+    def flush(self) -> None:
+        """Write the FAISS index if it has unsaved changes."""
+        with self._index_lock:
+            if self._unsaved:
+                self._save()
 
     def __len__(self) -> int:
         """
@@ -185,18 +367,41 @@ class VectorStore:
         return self.index.ntotal
 
     def _save(self) -> None:
-        """Persist FAISS index + metadata to disk."""
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump({"ids": self.ids, "meta": self.meta}, f, ensure_ascii=False, indent=2)
+        """Persist the FAISS index to disk (metadata is already in SQLite)."""
+        with self._index_lock:
+            faiss.write_index(self.index, self.index_path)
+            self._unsaved = 0
 
     def _load(self) -> None:
-        """Load FAISS index + metadata from disk."""
-        self.index = faiss.read_index(self.index_path)
-        with open(self.meta_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            self.ids  = data["ids"]
-            self.meta = data["meta"]
+        """Load the FAISS index, importing legacy JSON metadata if present."""
+        index = faiss.read_index(self.index_path)
+        if hasattr(index, "id_map") or faiss.try_extract_index_ivf(index) is not None:
+            self.index = index
+            self._tune(self.index)
+        elif index.ntotal:
+            # legacy plain flat index: FAISS ids are the row positions
+            self.index.add_with_ids(
+                index.reconstruct_n(0, index.ntotal),
+                np.arange(index.ntotal, dtype="int64"),
+            )
+        self._maybe_upgrade()
+
+        if not os.path.exists(LEGACY_META_PATH):
+            return
+        (count,) = self._mdb.execute("SELECT COUNT(*) FROM meta").fetchone()
+        if not count:
+            with open(LEGACY_META_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            fids = data.get("fids") or {eid: i for i, eid in enumerate(data["ids"])}
+            with self._mdb:
+                self._mdb.executemany(
+                    "INSERT INTO meta VALUES (?,?,?,?)",
+                    [(eid, fid, data["meta"][eid]["text"],
+                      json.dumps(data["meta"][eid]["metadata"], ensure_ascii=False))
+                     for eid, fid in fids.items()],
+                )
+        # retire it, or an emptied meta table (clear()) would re-import stale rows
+        os.replace(LEGACY_META_PATH, LEGACY_META_PATH + ".imported")
 
 
 # — Example usage —
@@ -1,22 +1,28 @@
-from sqlmodel import SQLModel, Session, create_engine, select
-from app.auth import User          # same model the API imports
-
-engine = create_engine("sqlite:///./users.db", echo=False)
-SQLModel.metadata.create_all(engine)
-
-with Session(engine) as s:
-    user = s.exec(select(User).where(User.email == "f.khann@gmail.com")).first()
-    if user:
-        user.password  = "Passw0rd!"
-        user.is_active = True
-        user.is_admin  = True
-        msg = "updated"
-    else:
-        user = User(email="f.khann@gmail.com",
-                    password="Passw0rd!",
-                    is_active=True,
-                    is_admin=True)
-        s.add(user)
-        msg = "created"
-    s.commit()
-    print(f"✅  Admin user {msg} in users.db")
+"""
+seed_users.py – bulk-register accounts from a CSV of `email,password` rows.
+Run from the backend folder:
+
+    python seed_users.py users.csv
+
+Accounts start unconfirmed / unapproved, exactly like /register; the
+confirmation links are printed so they can be opened (or approved by an admin).
+"""
+
+import csv
+import sys
+
+from app.db import bulk_register
+
+
+def main(path: str) -> None:
+    with open(path, newline="", encoding="utf-8") as f:
+        users = [(row[0].strip(), row[1]) for row in csv.reader(f) if len(row) >= 2]
+    for email, token in bulk_register(users):
+        print(f"{email}: /confirm_email?token={token}")
+    print(f"✅  {len(users)} users registered")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python seed_users.py users.csv")
+    main(sys.argv[1])
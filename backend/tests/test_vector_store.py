@@ -0,0 +1,133 @@
+import hashlib
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("openai")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import vector_store as vs  # noqa: E402
+
+DIM = 8
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for client.embeddings (one vector per text)."""
+
+    def create(self, model, input):
+        texts = [input] if isinstance(input, str) else input
+        data = []
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(t.encode()).digest()[:8], "little")
+            vec = np.random.default_rng(seed).standard_normal(DIM).astype("float32")
+            data.append(SimpleNamespace(embedding=vec.tolist(), index=i))
+        return SimpleNamespace(data=data)
+
+
+def make_store(tmp_path, index_type):
+    return vs.VectorStore(
+        client=SimpleNamespace(embeddings=FakeEmbeddings()),
+        index_path=str(tmp_path / "index"),
+        meta_path=str(tmp_path / "meta.db"),
+        cache_path=str(tmp_path / "cache.db"),
+        index_type=index_type,
+    )
+
+
+@pytest.fixture(autouse=True)
+def small_thresholds(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # LEGACY_META_PATH is relative
+    monkeypatch.setattr(vs, "HNSW_MIN", 20)
+    monkeypatch.setattr(vs, "IVF_NLIST", 2)  # trains at 2 * 39 = 78 vectors
+
+
+@pytest.mark.parametrize("index_type,n,kind", [
+    ("flat", 30, "IndexIDMap2"),
+    ("hnsw", 30, "IndexIDMap2"),
+    ("ivf", 100, "IndexIVFFlat"),
+])
+def test_add_delete_upgrade_reload(tmp_path, index_type, n, kind):
+    import faiss
+
+    store = make_store(tmp_path, index_type)
+    ids = store.add_texts([f"doc {i}" for i in range(n)])
+    assert len(store) == n
+    assert type(store.index).__name__ == kind
+    if index_type == "hnsw":
+        assert isinstance(faiss.downcast_index(store.index.index), faiss.IndexHNSW)
+
+    hit = store.search("doc 7", k=1)[0]
+    assert hit["id"] == ids[7] and hit["text"] == "doc 7"
+
+    assert store.delete(ids[7])
+    assert not store.delete(ids[7])
+    assert len(store) == n - 1
+    assert all(h["id"] != ids[7] for h in store.search("doc 7", k=5))
+
+    reloaded = make_store(tmp_path, index_type)
+    assert len(reloaded) == n - 1
+    assert type(reloaded.index).__name__ == kind
+    assert reloaded.search("doc 3", k=1)[0]["id"] == ids[3]
+    assert reloaded.next_fid == n
+
+
+def test_hnsw_delete_below_threshold_drops_to_flat(tmp_path):
+    import faiss
+
+    store = make_store(tmp_path, "hnsw")
+    ids = store.add_texts([f"doc {i}" for i in range(20)])
+    assert isinstance(faiss.downcast_index(store.index.index), faiss.IndexHNSW)
+    store.delete(ids[0])
+    assert store._is_flat()
+    assert store.search("doc 5", k=1)[0]["id"] == ids[5]
+
+
+def test_concurrent_adds_get_unique_ids(tmp_path):
+    store = make_store(tmp_path, "hnsw")
+    errors = []
+
+    def worker(w):
+        try:
+            for j in range(5):
+                store.add_texts([f"w{w} doc {j} {k}" for k in range(50)], persist=False)
+        except Exception as e:  # pragma: no cover - surfaced below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(store) == 1000
+    (count,) = store._mdb.execute("SELECT COUNT(DISTINCT fid) FROM meta").fetchone()
+    assert count == 1000
+
+
+def test_legacy_json_imported_once(tmp_path):
+    import json
+
+    store = make_store(tmp_path, "flat")
+    store.add_texts(["a", "b"])
+    store.flush()
+    store._mdb.execute("DELETE FROM meta")
+    store._mdb.commit()
+    meta = {"ids": ["x", "y"], "meta": {
+        "x": {"text": "a", "metadata": {}}, "y": {"text": "b", "metadata": {}},
+    }}
+    (tmp_path / vs.LEGACY_META_PATH).write_text(json.dumps(meta))
+
+    store = make_store(tmp_path, "flat")
+    assert store.search("b", k=1)[0]["id"] == "y"
+    assert not (tmp_path / vs.LEGACY_META_PATH).exists()
+
+    store.clear()
+    store = make_store(tmp_path, "flat")
+    (count,) = store._mdb.execute("SELECT COUNT(*) FROM meta").fetchone()
+    assert count == 0